@@ -7,171 +7,538 @@
  *   node deploy-and-configure.mjs [--profile PROFILE] [--region REGION] [--stack-name STACK_NAME]
  */
 
-import { execFileSync } from "node:child_process";
-import { existsSync, writeFileSync } from "node:fs";
-import { dirname, resolve } from "node:path";
+import { execFile, spawn } from "node:child_process";
+import { createHash } from "node:crypto";
+import { accessSync, constants, existsSync, statSync, writeFileSync } from "node:fs";
+import { readFile, readdir, stat } from "node:fs/promises";
+import { createRequire } from "node:module";
+import { basename, dirname, resolve } from "node:path";
 import { fileURLToPath } from "node:url";
-import { parseArgs } from "node:util";
+import { parseArgs, promisify } from "node:util";
+
+const execFileAsync = promisify(execFile);
 
 const __dirname = dirname(fileURLToPath(import.meta.url));
+const IS_WINDOWS = process.platform === "win32";
 
 // ── colours ──────────────────────────────────────────────────────────────────
-const NO_COLOR =
-  process.env.NO_COLOR ||
-  (process.platform === "win32" && process.env.TERM !== "xterm");
-
-const c = NO_COLOR
-  ? { h: "", b: "", ok: "", warn: "", err: "", cyan: "", reset: "" }
-  : {
-      h: "\x1b[95m",
-      b: "\x1b[1m",
-      ok: "\x1b[92m",
-      warn: "\x1b[93m",
-      err: "\x1b[91m",
-      cyan: "\x1b[96m",
-      blue: "\x1b[94m",
-      reset: "\x1b[0m",
-    };
-
-const step = (msg) => console.log(`\n${c.blue}> ${msg}${c.reset}`);
-const ok = (msg) => console.log(`${c.ok}+ ${msg}${c.reset}`);
-const warn = (msg) => console.log(`${c.warn}! ${msg}${c.reset}`);
-const fail = (msg) => console.error(`${c.err}x ${msg}${c.reset}`);
+const NO_COLOR = process.env.NO_COLOR || (IS_WINDOWS && process.env.TERM !== "xterm");
+
+const c = {
+  h: "\x1b[95m",
+  b: "\x1b[1m",
+  ok: "\x1b[92m",
+  warn: "\x1b[93m",
+  err: "\x1b[91m",
+  cyan: "\x1b[96m",
+  blue: "\x1b[94m",
+  reset: "\x1b[0m",
+};
+
+// Blank every escape code in one pass; "what counts as a colour" lives here
+// rather than in a hand-maintained list that can drift as codes are added.
+function disableColors() {
+  for (const [key, value] of Object.entries(c)) {
+    if (value.startsWith("\x1b")) c[key] = "";
+  }
+  bindLogHelpers();
+}
+
+let step, ok, warn, fail;
+
+// Pick the plain or coloured formatters once per colour decision, so the
+// per-line hot path never interpolates (possibly empty) escape codes — this
+// shows up when thousands of streamed build lines pass through the helpers.
+function bindLogHelpers() {
+  if (c.reset) {
+    step = (msg) => console.log(`\n${c.blue}> ${msg}${c.reset}`);
+    ok = (msg) => console.log(`${c.ok}+ ${msg}${c.reset}`);
+    warn = (msg) => console.log(`${c.warn}! ${msg}${c.reset}`);
+    fail = (msg) => console.error(`${c.err}x ${msg}${c.reset}`);
+  } else {
+    step = (msg) => console.log(`\n> ${msg}`);
+    ok = (msg) => console.log(`+ ${msg}`);
+    warn = (msg) => console.log(`! ${msg}`);
+    fail = (msg) => console.error(`x ${msg}`);
+  }
+}
+
+bindLogHelpers();
+if (NO_COLOR) disableColors();
 
 // ── helpers ──────────────────────────────────────────────────────────────────
+const TAIL_LINES = 200;
+
+// Echo a child stream live and keep only the last TAIL_LINES lines so memory
+// stays flat no matter how much a long sam build/deploy logs.
+function tailStream(src, dst, tail) {
+  let pending = "";
+  src.setEncoding("utf8");
+  src.on("data", (chunk) => {
+    dst.write(chunk);
+    pending += chunk;
+    let nl;
+    while ((nl = pending.indexOf("\n")) !== -1) {
+      tail.push(pending.slice(0, nl));
+      if (tail.length > TAIL_LINES) tail.shift();
+      pending = pending.slice(nl + 1);
+    }
+  });
+  src.on("end", () => {
+    if (pending) {
+      tail.push(pending);
+      if (tail.length > TAIL_LINES) tail.shift();
+    }
+  });
+}
+
+// Streams output live by default; pass capture: true for short commands whose
+// full stdout is parsed (no echo, unbounded buffer, same as the old behavior).
 function run(cmd, args, opts = {}) {
-  const env = { ...process.env, ...opts.env };
-  try {
-    const stdout = execFileSync(cmd, args, {
+  // Only copy the environment when there are overrides; spawn inherits the
+  // parent env directly when env is undefined.
+  const env = opts.env ? { ...process.env, ...opts.env } : undefined;
+  return new Promise((done) => {
+    const child = spawn(cmd, args, {
       cwd: opts.cwd,
       env,
       stdio: ["inherit", "pipe", "pipe"],
-      shell: process.platform === "win32",
+      shell: IS_WINDOWS,
     });
-    return { ok: true, stdout: stdout.toString() };
-  } catch (e) {
-    return { ok: false, stdout: e.stdout?.toString() ?? "", stderr: e.stderr?.toString() ?? "" };
+
+    const outTail = [];
+    const errTail = [];
+    if (opts.capture) {
+      child.stdout.setEncoding("utf8");
+      child.stderr.setEncoding("utf8");
+      child.stdout.on("data", (chunk) => outTail.push(chunk));
+      child.stderr.on("data", (chunk) => errTail.push(chunk));
+    } else {
+      tailStream(child.stdout, process.stdout, outTail);
+      tailStream(child.stderr, process.stderr, errTail);
+    }
+
+    child.on("error", (e) => done({ ok: false, stdout: "", stderr: e.message }));
+    child.on("close", (code) =>
+      done({
+        ok: code === 0,
+        stdout: opts.capture ? outTail.join("") : outTail.join("\n"),
+        stderr: opts.capture ? errTail.join("") : errTail.join("\n"),
+      }),
+    );
+  });
+}
+
+// Walk PATH directly instead of spawning `tool --version` to answer "is it
+// installed?" — a few stat calls versus a full process launch per tool.
+function which(cmd) {
+  const dirs = (process.env.PATH ?? "").split(IS_WINDOWS ? ";" : ":");
+  const exts = IS_WINDOWS ? (process.env.PATHEXT ?? ".COM;.EXE;.BAT;.CMD").split(";") : [""];
+  for (const dir of dirs) {
+    if (!dir) continue;
+    for (const ext of exts) {
+      const candidate = resolve(dir, cmd + ext);
+      try {
+        accessSync(candidate, constants.X_OK);
+        if (statSync(candidate).isFile()) return candidate;
+      } catch {
+        // Not here; keep walking.
+      }
+    }
+  }
+  return null;
+}
+
+// Version strings, e.g. toolVersions.sam = "SAM CLI, version 1.100.0".
+// Populated lazily (version-gated flags) or by the --verbose probes.
+const toolVersions = {};
+
+async function probeVersion(tool) {
+  if (!(tool in toolVersions)) {
+    try {
+      const { stdout } = await execFileAsync(tool, ["--version"], { shell: IS_WINDOWS });
+      toolVersions[tool] = stdout.toString().trim().split("\n")[0];
+    } catch {
+      toolVersions[tool] = null;
+    }
   }
+  return toolVersions[tool];
 }
 
-function checkPrerequisites() {
+async function samAtLeast(major, minor) {
+  const m = /version\s+(\d+)\.(\d+)/.exec((await probeVersion("sam")) ?? "");
+  if (!m) return false;
+  const [maj, min] = [Number(m[1]), Number(m[2])];
+  return maj > major || (maj === major && min >= minor);
+}
+
+async function checkPrerequisites(tools = ["sam", "aws"], { verbose = false } = {}) {
   step("Checking prerequisites...");
   let allGood = true;
-  for (const [tool, args] of [["sam", ["--version"]], ["aws", ["--version"]]]) {
-    const r = run(tool, args);
-    if (r.ok) {
-      ok(`${tool}: ${r.stdout.trim().split("\n")[0]}`);
+  for (const tool of tools) {
+    const path = which(tool);
+    if (path) {
+      ok(`${tool}: ${path}`);
     } else {
       fail(`${tool} is not installed or not in PATH`);
       allGood = false;
     }
   }
+
+  // Version strings cost a process spawn each, so fetch them only on request;
+  // the probes are independent and run as one concurrent batch.
+  if (verbose && allGood) {
+    const versions = await Promise.all(tools.map((tool) => probeVersion(tool)));
+    for (let i = 0; i < tools.length; i++) {
+      if (versions[i]) ok(`${tools[i]}: ${versions[i]}`);
+    }
+  }
   return allGood;
 }
 
-function buildBackend(backendDir, profile) {
+// Validate the project layout before probing tools: the layout check is a
+// single cheap readdir (one syscall answers every "does this subdirectory
+// exist?" question), so a broken checkout fails before we pay for process
+// spawns. The tool probes themselves still run as one concurrent batch.
+async function preflight(backendDir, frontendDir, { configOnly = false, verbose = false } = {}) {
+  const entries = await readdir(__dirname, { withFileTypes: true }).catch(() => []);
+  const subdirs = new Set();
+  for (const entry of entries) {
+    // Dirent.isDirectory() does not follow symlinks; stat those so a checkout
+    // with a symlinked backend/ or frontend/ still passes.
+    if (entry.isDirectory()) {
+      subdirs.add(entry.name);
+    } else if (entry.isSymbolicLink()) {
+      const target = await stat(resolve(__dirname, entry.name)).catch(() => null);
+      if (target?.isDirectory()) subdirs.add(entry.name);
+    }
+  }
+
+  let layoutOk = true;
+  if (!subdirs.has(basename(backendDir))) {
+    fail(`Backend directory not found: ${backendDir}`);
+    layoutOk = false;
+  }
+  if (!subdirs.has(basename(frontendDir))) {
+    fail(`Frontend directory not found: ${frontendDir}`);
+    layoutOk = false;
+  }
+  if (!layoutOk) return false;
+
+  // --config-only never builds or deploys, so sam is not required.
+  const tools = configOnly ? ["aws"] : ["sam", "aws"];
+  return checkPrerequisites(tools, { verbose });
+}
+
+// Everything sam build reads: the template, the Rust crate, and the Node
+// function sources plus the npm manifests their esbuild bundles draw
+// dependencies from. db/ (migrations) and tests/ do not affect build output.
+const BUILD_HASH_SOURCES = [
+  "template.yaml",
+  "Cargo.toml",
+  "package.json",
+  "package-lock.json",
+  "src",
+  "functions",
+];
+
+async function computeBuildHash(backendDir) {
+  const files = [];
+  const walk = async (dir) => {
+    for (const entry of await readdir(dir, { withFileTypes: true })) {
+      const path = resolve(dir, entry.name);
+      if (entry.isDirectory()) await walk(path);
+      else files.push(path);
+    }
+  };
+  for (const rel of BUILD_HASH_SOURCES) {
+    const path = resolve(backendDir, rel);
+    const info = await stat(path).catch(() => null);
+    if (info?.isDirectory()) await walk(path);
+    else if (info) files.push(path);
+    // Missing roots simply don't contribute to the hash.
+  }
+  files.sort();
+  const hash = createHash("blake2b512");
+  for (const file of files) {
+    hash.update(file);
+    hash.update(await readFile(file));
+  }
+  return hash.digest("hex");
+}
+
+async function buildBackend(backendDir, profile, { parallel = true } = {}) {
   step("Building backend...");
+
+  // Skip launching SAM entirely when the sources are byte-identical to the
+  // last successful build; complements sam's own --cached, which still pays
+  // CLI startup to discover there is nothing to do.
+  const hashFile = resolve(backendDir, ".aws-sam", ".build-hash");
+  let sourceHash = null;
+  try {
+    sourceHash = await computeBuildHash(backendDir);
+    if (existsSync(resolve(backendDir, ".aws-sam", "build"))) {
+      const previous = await readFile(hashFile, "utf-8").catch(() => null);
+      if (previous?.trim() === sourceHash) {
+        ok("Build cache hit (source hash unchanged), skipping sam build");
+        return true;
+      }
+    }
+  } catch {
+    // Hashing is best-effort; fall through to a normal build.
+  }
+
   const env = { SAM_CLI_TELEMETRY: "0" };
   if (profile) env.AWS_PROFILE = profile;
 
-  const r = run("sam", ["build"], { cwd: backendDir, env });
+  const args = ["build"];
+  if (parallel) {
+    if (await samAtLeast(1, 9)) {
+      // Build functions concurrently and reuse unchanged build artifacts.
+      args.push("--parallel", "--cached");
+    } else {
+      warn("SAM CLI < 1.9 detected; building sequentially (--parallel unsupported)");
+    }
+  }
+
+  const r = await run("sam", args, { cwd: backendDir, env });
   if (r.ok) {
     ok("Backend built successfully");
+    if (sourceHash) {
+      try {
+        writeFileSync(hashFile, sourceHash, "utf-8");
+      } catch {
+        // Best-effort; the next run just rebuilds.
+      }
+    }
     return true;
   }
-  fail("Backend build failed");
-  if (r.stdout.trim()) console.log(r.stdout);
-  if (r.stderr?.trim()) console.error(r.stderr);
+  fail("Backend build failed (output above)");
   return false;
 }
 
-function deployBackend(backendDir, { profile, region, stackName, parameterOverrides }) {
+async function deployBackend(backendDir, { profile, region, stackName, parameterOverrides, parallelUpload, ci }) {
   step("Deploying backend...");
   const args = ["deploy"];
   if (profile) args.push("--profile", profile);
   if (region) args.push("--region", region);
   if (stackName) args.push("--stack-name", stackName);
   if (parameterOverrides) args.push("--parameter-overrides", parameterOverrides);
+  if (parallelUpload) {
+    if (await samAtLeast(1, 139)) {
+      // Upload function artifacts to S3/ECR concurrently instead of one at a
+      // time. Opt-in because it raises CPU and bandwidth use during packaging.
+      args.push("--parallel-upload");
+    } else {
+      warn("SAM CLI < 1.139 detected; uploading artifacts sequentially (--parallel-upload unsupported)");
+    }
+  }
+  // Progress animation frames are wasted writes in captured CI logs.
+  if (ci) args.push("--no-progressbar");
 
-  const env = {};
-  if (profile) env.AWS_PROFILE = profile;
+  const env = profile ? { AWS_PROFILE: profile } : undefined;
 
-  const r = run("sam", args, { cwd: backendDir, env });
+  const r = await run("sam", args, { cwd: backendDir, env });
   if (r.ok) {
     ok("Backend deployed successfully");
     return true;
   }
-  fail("Backend deployment failed");
-  if (r.stdout.trim()) console.log(r.stdout);
-  if (r.stderr?.trim()) console.error(r.stderr);
+  // sam deploy exits non-zero on an empty changeset; for this script that is
+  // a successful no-op, so continue straight to output retrieval.
+  if (/no changes to deploy/i.test(r.stderr) || /no changes to deploy/i.test(r.stdout)) {
+    ok("No changes to deploy; stack is already up to date");
+    return true;
+  }
+  fail("Backend deployment failed (output above)");
   return false;
 }
 
-function getStackOutputs(stackName, { profile, region }) {
+// The CloudFormation SDK client is a strictly optional accelerator and is
+// deliberately not declared in backend/package.json: when an install of
+// @aws-sdk/client-cloudformation is present in the backend's node_modules we
+// call CloudFormation in-process, skipping the CLI's per-invocation startup
+// cost and reusing one TLS connection across calls. The aws CLI fallback is
+// the always-available path on a clean checkout.
+let _cfnSdk;
+function loadCfnSdk() {
+  if (_cfnSdk === undefined) {
+    try {
+      const requireFromBackend = createRequire(resolve(__dirname, "backend", "package.json"));
+      _cfnSdk = requireFromBackend("@aws-sdk/client-cloudformation");
+    } catch {
+      _cfnSdk = null;
+    }
+  }
+  return _cfnSdk;
+}
+
+// One client per profile/region pair, shared by every CloudFormation call in
+// a run (outputs fetch, readiness poll, anything added later). Building a
+// client costs hundreds of milliseconds of service-model setup, and reuse
+// keeps the TLS session and keep-alive connection warm across calls.
+// Adaptive retry mode backs off client-side if CloudFormation throttles.
+const _cfnClients = new Map();
+function getCfnClient(sdk, { profile, region }) {
+  const key = `${profile ?? ""}\0${region ?? ""}`;
+  let client = _cfnClients.get(key);
+  if (!client) {
+    client = new sdk.CloudFormationClient({
+      ...(region ? { region } : {}),
+      ...(profile ? { profile } : {}),
+      retryMode: "adaptive",
+      maxAttempts: 10,
+    });
+    _cfnClients.set(key, client);
+  }
+  return client;
+}
+
+function indexStackOutputs(stacks) {
+  return Object.fromEntries(
+    stacks.map((s) => [
+      s.StackName,
+      Object.fromEntries((s.Outputs ?? []).map((o) => [o.OutputKey, o.OutputValue])),
+    ]),
+  );
+}
+
+function pickStackOutputs(byName, stackNames) {
+  const result = {};
+  for (const name of stackNames) {
+    if (!(name in byName)) {
+      fail(`Stack not found: ${name}`);
+      return null;
+    }
+    result[name] = byName[name];
+    ok(`${name}: retrieved ${Object.keys(result[name]).length} outputs`);
+  }
+  return result;
+}
+
+async function getStackOutputs(stackNames, { profile, region }) {
   step("Retrieving stack outputs...");
+  // One DescribeStacks call without a stack-name filter returns every stack;
+  // filter locally instead of issuing one API call per stack and risking
+  // throttling.
+  const sdk = loadCfnSdk();
+  if (sdk) {
+    try {
+      const cfn = getCfnClient(sdk, { profile, region });
+      const stacks = [];
+      let NextToken;
+      do {
+        const resp = await cfn.send(new sdk.DescribeStacksCommand({ NextToken }));
+        stacks.push(...(resp.Stacks ?? []));
+        NextToken = resp.NextToken;
+      } while (NextToken);
+      return pickStackOutputs(indexStackOutputs(stacks), stackNames);
+    } catch (e) {
+      fail(`Failed to retrieve stack outputs: ${e.message}`);
+      return null;
+    }
+  }
+
+  // Ask the CLI for pre-flattened text rows instead of a JSON document: the
+  // JMESPath query emits each stack name on its own line followed by one
+  // tab-separated OutputKey/OutputValue pair per line, which we consume
+  // line-by-line without materializing a parse tree.
   const args = [
     "cloudformation", "describe-stacks",
-    "--stack-name", stackName,
-    "--query", "Stacks[0].Outputs",
-    "--output", "json",
+    "--query", "Stacks[].[StackName, Outputs[].[OutputKey, OutputValue]]",
+    "--output", "text",
   ];
   if (profile) args.push("--profile", profile);
   if (region) args.push("--region", region);
 
-  const env = {};
-  if (profile) env.AWS_PROFILE = profile;
+  const env = profile ? { AWS_PROFILE: profile } : undefined;
 
-  const r = run("aws", args, { env });
+  const r = await run("aws", args, { env, capture: true });
   if (!r.ok) {
     fail("Failed to retrieve stack outputs");
     if (r.stderr) console.error(r.stderr);
     return null;
   }
-  try {
-    const outputs = JSON.parse(r.stdout);
-    const map = Object.fromEntries(outputs.map((o) => [o.OutputKey, o.OutputValue]));
-    ok(`Retrieved ${Object.keys(map).length} outputs`);
-    return map;
-  } catch (e) {
-    fail(`Failed to parse stack outputs: ${e.message}`);
-    return null;
+  // Scan the rows in place instead of splitting the whole buffer into a line
+  // array up front; the response can be sizeable when many stacks carry many
+  // long output values.
+  const byName = {};
+  let current = null;
+  const text = r.stdout;
+  for (let start = 0; start < text.length; ) {
+    let end = text.indexOf("\n", start);
+    if (end === -1) end = text.length;
+    const line = text.slice(start, end);
+    start = end + 1;
+    if (!line || line === "None") continue;
+    const tab = line.indexOf("\t");
+    if (tab === -1) {
+      current = byName[line] = {};
+    } else if (current) {
+      current[line.slice(0, tab)] = line.slice(tab + 1);
+    }
+  }
+  return pickStackOutputs(byName, stackNames);
+}
+
+// Confirm the stack settled in a terminal state after deploy. sam deploy
+// blocks until the changeset finishes, so in the common case this is a single
+// describe call on the already-warm client; if the stack is still in
+// progress (e.g. a concurrent update), poll with a fixed delay rather than
+// paying CLI startup per probe. No-op when the SDK is unavailable.
+// The only terminal states a fresh deploy should land in; rollback states
+// also end in _COMPLETE but mean the deploy did not stick.
+const STACK_READY_STATES = new Set(["CREATE_COMPLETE", "UPDATE_COMPLETE", "IMPORT_COMPLETE"]);
+
+async function waitForStackStable(sdk, stackName, { profile, region }) {
+  const delayMs = 10_000;
+  const maxAttempts = 120;
+  const cfn = getCfnClient(sdk, { profile, region });
+  for (let attempt = 0; attempt < maxAttempts; attempt++) {
+    let status;
+    try {
+      const resp = await cfn.send(new sdk.DescribeStacksCommand({ StackName: stackName }));
+      status = resp.Stacks?.[0]?.StackStatus ?? "";
+    } catch (e) {
+      fail(`Failed to check status of stack ${stackName}: ${e.message}`);
+      return false;
+    }
+    if (STACK_READY_STATES.has(status)) return true;
+    if (!status.endsWith("_IN_PROGRESS")) {
+      fail(`Stack ${stackName} is in state ${status}`);
+      return false;
+    }
+    if (attempt === 0) step(`Waiting for stack ${stackName} to stabilize (${status})...`);
+    await new Promise((r) => setTimeout(r, delayMs));
   }
+  fail(`Timed out waiting for stack ${stackName} to stabilize`);
+  return false;
 }
 
 function createEnvFile(frontendDir, outputs, region) {
   step("Creating frontend .env file...");
   const envPath = resolve(frontendDir, ".env");
-  const content = `# AWS Amplify Configuration
-# Auto-generated by deploy-and-configure.mjs
-
-# Cognito User Pool ID
-VITE_USER_POOL_ID=${outputs.UserPoolId ?? ""}
-
-# Cognito User Pool Client ID
-VITE_USER_POOL_CLIENT_ID=${outputs.UserPoolClientId ?? ""}
-
-# Cognito Hosted UI Domain
-VITE_USER_POOL_DOMAIN=${outputs.UserPoolDomain ?? ""}
-
-# API Gateway Endpoint URL
-VITE_API_URL=${outputs.ApiUrl ?? ""}
-
-# Frontend URL (using localhost for local development)
-VITE_FRONTEND_URL=http://localhost:5173
-
-# AWS Region
-VITE_AWS_REGION=${region}
-`;
+  // Keep the variables as structured [comment, key, value] entries: the file
+  // text and the printed summary both derive from this list, so there is no
+  // re-parsing of the generated file (which would misread values containing
+  // '#' or '=').
+  const entries = [
+    ["Cognito User Pool ID", "VITE_USER_POOL_ID", outputs.UserPoolId ?? ""],
+    ["Cognito User Pool Client ID", "VITE_USER_POOL_CLIENT_ID", outputs.UserPoolClientId ?? ""],
+    ["Cognito Hosted UI Domain", "VITE_USER_POOL_DOMAIN", outputs.UserPoolDomain ?? ""],
+    ["API Gateway Endpoint URL", "VITE_API_URL", outputs.ApiUrl ?? ""],
+    ["Frontend URL (using localhost for local development)", "VITE_FRONTEND_URL", "http://localhost:5173"],
+    ["AWS Region", "VITE_AWS_REGION", region],
+  ];
+  const content =
+    "# AWS Amplify Configuration\n# Auto-generated by deploy-and-configure.mjs\n\n" +
+    entries.map(([comment, key, value]) => `# ${comment}\n${key}=${value}\n`).join("\n");
 
   try {
     writeFileSync(envPath, content, "utf-8");
     ok(`Created ${envPath}`);
     console.log(`\n${c.cyan}Environment variables configured:${c.reset}`);
-    for (const line of content.split("\n")) {
-      if (line && !line.startsWith("#") && line.includes("=")) {
-        const [key, ...rest] = line.split("=");
-        console.log(`  ${key}: ${rest.join("=")}`);
-      }
+    for (const [, key, value] of entries) {
+      console.log(`  ${key}: ${value}`);
     }
     return true;
   } catch (e) {
@@ -181,7 +548,7 @@ VITE_AWS_REGION=${region}
 }
 
 // ── main ─────────────────────────────────────────────────────────────────────
-function main() {
+async function main() {
   process.env.SAM_CLI_TELEMETRY ??= "0";
   process.env.AWS_PAGER ??= "";
 
@@ -195,11 +562,16 @@ function main() {
       "skip-deploy":        { type: "boolean", default: false },
       "config-only":        { type: "boolean", default: false },
       "no-color":           { type: "boolean", default: false },
+      "no-parallel-build":  { type: "boolean", default: false },
+      "parallel-upload":    { type: "boolean", default: false },
+      verbose:              { type: "boolean", default: false },
       ci:                   { type: "boolean", default: false },
     },
     strict: true,
   });
 
+  if (values["no-color"]) disableColors();
+
   const skipBuild  = values["skip-build"]  || values["config-only"];
   const skipDeploy = values["skip-deploy"] || values["config-only"];
   const profile    = values.profile;
@@ -211,9 +583,6 @@ function main() {
   const backendDir  = resolve(__dirname, "backend");
   const frontendDir = resolve(__dirname, "frontend");
 
-  if (!existsSync(backendDir))  { fail(`Backend directory not found: ${backendDir}`);  process.exit(1); }
-  if (!existsSync(frontendDir)) { fail(`Frontend directory not found: ${frontendDir}`); process.exit(1); }
-
   console.log(`${c.h}${c.b}`);
   console.log("=".repeat(60));
   console.log("  Community Garden App - Deploy & Configure");
@@ -225,21 +594,26 @@ function main() {
   console.log(`Region:   ${region}`);
   console.log(`Stack:    ${stackName}`);
 
-  if (!checkPrerequisites()) {
-    fail("Missing required tools. Please install them and try again.");
+  if (!(await preflight(backendDir, frontendDir, { configOnly: values["config-only"], verbose: values.verbose }))) {
+    fail("Preflight checks failed. Fix the issues above and try again.");
     process.exit(1);
   }
 
   if (!skipBuild && !skipDeploy) {
-    if (!buildBackend(backendDir, profile)) process.exit(1);
+    if (!(await buildBackend(backendDir, profile, { parallel: !values["no-parallel-build"] }))) process.exit(1);
   }
 
   if (!skipDeploy) {
-    if (!deployBackend(backendDir, { profile, region, stackName, parameterOverrides })) process.exit(1);
+    const parallelUpload = values["parallel-upload"] || ciMode;
+    if (!(await deployBackend(backendDir, { profile, region, stackName, parameterOverrides, parallelUpload, ci: ciMode }))) process.exit(1);
+
+    const sdk = loadCfnSdk();
+    if (sdk && !(await waitForStackStable(sdk, stackName, { profile, region }))) process.exit(1);
   }
 
-  const outputs = getStackOutputs(stackName, { profile, region });
-  if (!outputs) process.exit(1);
+  const outputsByStack = await getStackOutputs([stackName], { profile, region });
+  if (!outputsByStack) process.exit(1);
+  const outputs = outputsByStack[stackName];
 
   if (!ciMode) {
     if (!createEnvFile(frontendDir, outputs, region)) process.exit(1);
@@ -257,4 +631,4 @@ function main() {
   }
 }
 
-main();
+await main();